@@ -0,0 +1,15 @@
+"""Gunicorn config for SJ Panel.
+
+gevent workers keep a worker responsive while slow external work
+(certbot, docker exec, nginx reload, Cloudflare calls) is in flight.
+Note: preload_app stays off because main.py starts daemon threads at
+import time and those would not survive the master fork.
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+worker_class = 'gevent'
+workers = 2 * multiprocessing.cpu_count() + 1
+worker_connections = 1000
+timeout = 600  # backups/restores can legitimately run for minutes
@@ -0,0 +1,18 @@
+"""
+WSGI entrypoint for production:
+
+    gunicorn -c gunicorn_conf.py wsgi:app
+
+gevent must monkey-patch the stdlib before main.py is imported so that
+subprocess calls and file/socket I/O yield to other greenlets instead of
+blocking the whole worker.
+"""
+
+from gevent import monkey
+monkey.patch_all()
+
+from main import app, load_users  # noqa: E402
+
+# Same startup work the dev-server path does in main.py; the directory
+# tree itself is created when main is imported.
+load_users()